@@ -11,24 +11,28 @@ For single command scripts, be more minimalist and just use argparse directly.
 '''
 
 
-from __future__ import absolute_import
-from __future__ import division
-from __future__ import unicode_literals
-from __future__ import print_function
-
-
 import argparse
+import sys
 
 
-__all__ = 'Command Parser'.split()
+__all__ = ('Command', 'Parser')
 
 
 class Command:
     '''
     Base class for application defined command classes that link
     argparse (user input), and a function.
+
+    Subclasses without their own state can declare `__slots__ = ()` to save
+    the per instance `__dict__`.
     '''
 
+    __slots__ = ()
+
+    # set to True for stateless commands, so that a class registered under
+    # more than one name is instantiated only once per parser tree
+    _cliscape_reusable = False
+
     def declare(self, arg):
         '''
         Declare command arguments by overriding it.
@@ -49,7 +53,8 @@ class Command:
 
         Defaults to the class docstring.
         '''
-        assert self.__doc__ is not None, self.__class__
+        if self.__doc__ is None:
+            raise ValueError(f'No description for {self.__class__}')
         return self.__doc__
 
     def run(self, args):
@@ -61,6 +66,27 @@ class Command:
         raise NotImplementedError
 
 
+def _arg(argparser, parser, args, kwargs):
+    '''
+    Implementation of `Parser.arg` for `argparser`.
+
+    `parser` is the `Parser` passed to a declaring function, or a function
+    making it, when it is needed.
+    '''
+    assert args
+    if not kwargs and len(args) == 1 and callable(*args):
+        if not isinstance(parser, Parser):
+            parser = parser()
+        args[0](parser)
+    else:
+        if 'default' in kwargs:
+            # extend help with default
+            help = kwargs.get('help', '')
+            default = kwargs['default']
+            kwargs['help'] = f'{help} (default: {default!r})'
+        argparser.add_argument(*args, **kwargs)
+
+
 class Parser:
     '''
     Wrapper for `argparse.ArgumentParser` with conveniences for multi-command
@@ -79,10 +105,32 @@ class Parser:
         # This is ugly :(
         # subparsers should be an `argparse` implementation detail, but is not
         self.__subparsers = None
-
-        def print_help(args):
-            self.argparser.print_help()
-        self.argparser.set_defaults(_cliscape__run=print_help)
+        # commands are declared to argparse only when `dispatch` needs them,
+        # as building their parsers is the bulk of the startup cost
+        self._by_name = {}
+        self._pending = {}
+        self._groups = {}
+        # Parsers made for the declaring functions of commands
+        self._nested = {}
+        # registration order of commands and groups
+        self._order = {}
+        # instances of `Command._cliscape_reusable` classes, shared by groups
+        self._instances = {}
+        # argparse lists all the commands in help and error messages
+        self.argparser.format_usage = self._format_usage
+        self.argparser.format_help = self._format_help
+        self.argparser.set_defaults(_cliscape__run=self._print_help)
+
+    def _format_usage(self):
+        self._declare_pending()
+        return type(self.argparser).format_usage(self.argparser)
+
+    def _format_help(self):
+        self._declare_pending()
+        return type(self.argparser).format_help(self.argparser)
+
+    def _print_help(self, args):
+        self.argparser.print_help()
 
     @classmethod
     def new(cls, *args, **kwargs):
@@ -102,22 +150,36 @@ class Parser:
             self.__subparsers = self.argparser.add_subparsers()
         return self.__subparsers
 
-    def _make_command(self, commandish):
+    def _check_command(self, commandish):
         '''
-        Make a proper Command instance.
+        Ensure `commandish` can be made into a Command, without making it.
 
         This is a convenience function to allow for easier to read client code,
         while still remaining quite strict on what is supported.
         '''
-        if isinstance(commandish, Command):
-            return commandish
-        if issubclass(commandish, Command):
-            instance = commandish()
-            return instance
+        if isinstance(commandish, type):
+            if issubclass(commandish, Command):
+                return
+        elif isinstance(commandish, Command):
+            return
         if callable(commandish):
             # XXX: introspect parameter names, default values, annotations?
             raise NotImplementedError(
                 'Can not yet work with vanilla callables')
+        raise TypeError(f'Not a command: {commandish!r}')
+
+    def _make_command(self, commandish):
+        '''
+        Make a proper Command instance from a `_check_command`-ed commandish.
+        '''
+        if isinstance(commandish, Command):
+            return commandish
+        if not commandish._cliscape_reusable:
+            return commandish()
+        instance = self._instances.get(commandish)
+        if instance is None:
+            instance = self._instances[commandish] = commandish()
+        return instance
 
     def arg(self, *args, **kwargs):
         '''
@@ -129,17 +191,26 @@ class Parser:
 
         The argument help is fixed up to show the default value.
         '''
-        assert args
-        if not kwargs and len(args) == 1 and callable(*args):
-            args[0](self)
-        else:
-            arg_kwargs = dict(kwargs)
-            if 'default' in kwargs:
-                # extend help with default
-                arg_kwargs['help'] = (
-                    '{} (default: {!r})'
-                    .format(kwargs.get('help', ''), kwargs['default']))
-            self.argparser.add_argument(*args, **arg_kwargs)
+        _arg(self.argparser, self, args, kwargs)
+
+    def _arg_for(self, name, argparser):
+        '''
+        Make `Parser.arg` for the `argparser` of command `name` without
+        wrapping it in a `Parser`.
+
+        The wrapper is made only when a function is given to `arg`, and kept
+        for `dispatch`, as the function may declare subcommands on it.
+        '''
+        def make_parser():
+            nested = self._nested.get(name)
+            if nested is None:
+                nested = self._nested[name] = self.__class__(argparser)
+                nested._instances = self._instances
+            return nested
+
+        def arg(*args, **kwargs):
+            _arg(argparser, make_parser, args, kwargs)
+        return arg
 
     def command(self, name, commandish, title):
         '''
@@ -148,30 +219,97 @@ class Parser:
         Its name will be `name` and its arguments are defined by `commandish`
         Its help line will be `title`, while its help will be generated from
         its arguments.
+
+        The command is made and declared to argparse only when it is needed
+        by `dispatch`, or for help and error messages.
         '''
+        self._check_command(commandish)
+        self._register(name)
+        self._by_name[name] = commandish
+        self._pending[name] = title
+
+    def _register(self, name):
+        if name in self._order:
+            raise ValueError(f'Command {name!r} is already declared')
+        self._order[name] = len(self._order)
+
+    def _declare_command(self, name, commandish, title):
         command = self._make_command(commandish)
         parser = self._subparsers.add_parser(
             name, help=title, description=command.description)
-        command.declare(self.__class__(parser).arg)
+        if type(command).declare is not Command.declare:
+            command.declare(self._arg_for(name, parser))
         parser.set_defaults(_cliscape__run=command.run)
 
+    def _declare_pending(self, names=None):
+        '''
+        Declare pending commands to argparse - the ones in `names` or all.
+        '''
+        declared = False
+        for name in list(self._pending):
+            if names is None or name in names:
+                title = self._pending.pop(name)
+                self._declare_command(name, self._by_name[name], title)
+                declared = True
+        if declared:
+            self._sort_declared()
+
+    def _sort_declared(self):
+        '''
+        Order the declared commands and groups as they were registered.
+
+        argparse lists them in declaration order, which depends on what
+        earlier `dispatch` calls needed.
+        '''
+        order = self._order
+        subparsers = self._subparsers
+        subparsers._choices_actions.sort(key=lambda action: order[action.dest])
+        # `choices` is the name to parser map, used for lookup as well
+        choices = sorted(
+            subparsers.choices.items(), key=lambda item: order[item[0]])
+        subparsers.choices.clear()
+        subparsers.choices.update(choices)
+
+    def _prepare(self, argv):
+        '''
+        Declare the pending commands parsing `argv` might need.
+
+        Only the command named by the first positional argument is declared,
+        unless it is not a command - argparse needs all of them to report an
+        invalid one. Help and usage messages declare the rest as needed.
+        '''
+        prefix_chars = self.argparser.prefix_chars
+        for i, token in enumerate(argv):
+            if not token or token[0] not in prefix_chars:
+                break
+        else:
+            self._declare_pending()
+            return
+
+        if token in self._groups:
+            self._groups[token]._prepare(argv[i + 1:])
+        elif token in self._by_name:
+            self._declare_pending((token,))
+            nested = self._nested.get(token)
+            if nested is not None:
+                nested._prepare(argv[i + 1:])
+        else:
+            self._declare_pending()
+
     def commands(self, *names_commands_and_title):
         '''
         Declare any number of commands in one step.
 
         Takes a sequence of alternating names, commands and titles.
         '''
-        names    = names_commands_and_title[0::3]
-        commands = names_commands_and_title[1::3]
-        titles   = names_commands_and_title[2::3]
-
         MISMATCH = 'Names, commands, and titles do not match up!'
-        assert len(names) == len(commands), MISMATCH
-        assert len(names) == len(titles), MISMATCH
-        assert all(isinstance(n, ''.__class__) for n in names), MISMATCH
-        assert all(isinstance(t, ''.__class__) for t in titles), MISMATCH
+        if len(names_commands_and_title) % 3:
+            raise ValueError(MISMATCH)
 
-        for name, command, title in zip(names, commands, titles):
+        items = iter(names_commands_and_title)
+        for name, command, title in zip(items, items, items):
+            if not isinstance(name, str) or not isinstance(title, str):
+                raise ValueError(MISMATCH)
             self.command(name, command, title)
 
     def group(self, name, title='', help=None):
@@ -180,13 +318,38 @@ class Parser:
 
         Returns a `Parser` for the group to declare subcommands.
         '''
+        self._register(name)
         parser = self._subparsers.add_parser(
             name, help=title + '...', description=help)
-        return self.__class__(parser)
+        group = self.__class__(parser)
+        group._instances = self._instances
+        self._groups[name] = group
+        return group
+
+    def _requires_arguments(self):
+        '''
+        Tell whether argparse would reject an empty argument list.
+        '''
+        argparser = self.argparser
+        return (
+            any(action.required for action in argparser._actions) or
+            any(group.required
+                for group in argparser._mutually_exclusive_groups))
 
     def dispatch(self, argv):
         '''
         Parse `argv` and dispatch to the appropriate command.
+
+        `argv` defaults to `sys.argv[1:]`, like for `argparse`.
         '''
+        if argv is None:
+            argv = sys.argv[1:]
+        if not argv and not self._requires_arguments():
+            run = self.argparser.get_default('_cliscape__run')
+            if run == self._print_help:
+                # nothing to parse, the result would be the help anyway
+                run(None)
+                return
+        self._prepare(argv)
         args = self.argparser.parse_args(argv)
         args._cliscape__run(args)
@@ -0,0 +1,346 @@
+import contextlib
+import io
+import unittest
+from unittest import mock
+
+import cliscape
+
+
+made = []
+
+
+class Foo(cliscape.Command):
+    '''Foo description'''
+
+    def __init__(self):
+        made.append('foo')
+
+    def declare(self, arg):
+        arg('x')
+        arg('--count', default=3, type=int, help='how many')
+
+    def run(self, args):
+        print('foo', args.x, args.count)
+
+
+class Bar(cliscape.Command):
+    '''Bar description'''
+
+    def __init__(self):
+        made.append('bar')
+
+    def run(self, args):
+        print('bar')
+
+
+class Baz(cliscape.Command):
+    '''Baz description'''
+
+    def __init__(self):
+        made.append('baz')
+
+    def run(self, args):
+        print('baz')
+
+
+def dispatch(parser, argv):
+    stdout, stderr = io.StringIO(), io.StringIO()
+    with contextlib.redirect_stdout(stdout), \
+            contextlib.redirect_stderr(stderr):
+        try:
+            parser.dispatch(argv)
+            status = 0
+        except SystemExit as e:
+            status = e.code
+    return status, stdout.getvalue(), stderr.getvalue()
+
+
+class Test_dispatch(unittest.TestCase):
+
+    def setUp(self):
+        del made[:]
+        self.parser = self.make_parser()
+
+    def make_parser(self):
+        parser = cliscape.Parser.new(prog='cli')
+        parser.arg('-v', action='store_true')
+        parser.commands(
+            'foo', Foo, 'foo title',
+            'bar', Bar, 'bar title')
+        return parser
+
+    def test_runs_command(self):
+        status, stdout, _ = dispatch(self.parser, ['foo', 'x', '--count=5'])
+        self.assertEqual(0, status)
+        self.assertEqual('foo x 5\n', stdout)
+
+    def test_makes_only_the_dispatched_command(self):
+        dispatch(self.parser, ['bar'])
+        self.assertEqual(['bar'], made)
+
+    def test_command_arguments_do_not_make_commands(self):
+        dispatch(self.parser, ['-v', 'foo', 'bar'])
+        self.assertEqual(['foo'], made)
+
+    def test_none_reads_sys_argv(self):
+        with mock.patch('sys.argv', ['cli', 'bar']):
+            _, stdout, _ = dispatch(self.parser, None)
+        self.assertEqual('bar\n', stdout)
+
+    def test_none_with_empty_sys_argv_prints_help(self):
+        with mock.patch('sys.argv', ['cli']):
+            status, stdout, _ = dispatch(self.parser, None)
+        self.assertEqual(0, status)
+        self.assert_lists_all_commands(stdout)
+
+    def test_no_arguments_with_required_argument_is_an_error(self):
+        self.parser.arg('--cfg', required=True)
+        status, _, stderr = dispatch(self.parser, [])
+        self.assertEqual(2, status)
+        self.assertIn('the following arguments are required: --cfg', stderr)
+
+    def test_no_arguments_with_required_exclusive_group_is_an_error(self):
+        def declare_exclusive(parser):
+            group = parser.argparser.add_mutually_exclusive_group(
+                required=True)
+            group.add_argument('--left', action='store_true')
+            group.add_argument('--right', action='store_true')
+        self.parser.arg(declare_exclusive)
+        status, _, stderr = dispatch(self.parser, [])
+        self.assertEqual(2, status)
+        self.assertIn('one of the arguments --left --right', stderr)
+
+    def test_command_help(self):
+        status, stdout, _ = dispatch(self.parser, ['foo', '-h'])
+        self.assertEqual(0, status)
+        self.assertIn('Foo description', stdout)
+        self.assertIn('how many (default: 3)', stdout)
+
+    def assert_lists_all_commands(self, text):
+        self.assertIn('{foo,bar}', text)
+
+    def test_no_arguments_prints_help_with_all_commands(self):
+        _, stdout, _ = dispatch(self.parser, [])
+        self.assert_lists_all_commands(stdout)
+        self.assertIn('bar title', stdout)
+
+    def test_help_lists_all_commands(self):
+        for argv in (['-h'], ['-h', 'foo'], ['-vh', 'foo'], ['--he', 'foo']):
+            status, stdout, _ = dispatch(self.make_parser(), argv)
+            self.assertEqual(0, status, argv)
+            self.assert_lists_all_commands(stdout)
+
+    def test_error_usage_lists_all_commands(self):
+        status, _, stderr = dispatch(self.parser, ['foo', 'x', '--bogus'])
+        self.assertEqual(2, status)
+        self.assert_lists_all_commands(stderr)
+
+    def test_invalid_command_lists_all_commands(self):
+        status, _, stderr = dispatch(self.parser, ['qux'])
+        self.assertEqual(2, status)
+        self.assertIn("choose from 'foo', 'bar'", stderr)
+
+    def test_invalid_command_before_valid_one_lists_all_commands(self):
+        status, _, stderr = dispatch(self.parser, ['qux', 'foo'])
+        self.assertEqual(2, status)
+        self.assertIn("choose from 'foo', 'bar'", stderr)
+
+    def test_commands_are_listed_in_registration_order(self):
+        dispatch(self.parser, ['bar'])
+        _, _, stderr = dispatch(self.parser, ['qux'])
+        self.assertIn("choose from 'foo', 'bar'", stderr)
+        self.assert_lists_all_commands(stderr)
+
+
+class Test_command(unittest.TestCase):
+
+    def setUp(self):
+        del made[:]
+        self.parser = cliscape.Parser.new(prog='cli')
+
+    def test_registration_does_not_make_command(self):
+        self.parser.command('foo', Foo, 'foo title')
+        self.assertEqual([], made)
+
+    def test_accepts_command_instance(self):
+        self.parser.command('foo', Foo(), 'foo title')
+        _, stdout, _ = dispatch(self.parser, ['foo', 'x'])
+        self.assertEqual('foo x 3\n', stdout)
+
+    def test_description_is_the_docstring(self):
+        class Later(cliscape.Command):
+            pass
+        Later.__doc__ = 'Later description'
+        self.assertEqual('Later description', Later().description)
+
+    def test_missing_description(self):
+        class Undocumented(cliscape.Command):
+            pass
+        with self.assertRaises(ValueError):
+            Undocumented().description
+
+    def test_rejects_duplicate_name(self):
+        self.parser.command('foo', Foo, 'foo title')
+        self.parser.group('grp')
+        for name in ('foo', 'grp'):
+            with self.assertRaises(ValueError):
+                self.parser.command(name, Bar, 'bar title')
+            with self.assertRaises(ValueError):
+                self.parser.group(name)
+
+    def test_rejects_duplicate_of_declared_command(self):
+        self.parser.command('foo', Foo, 'foo title')
+        dispatch(self.parser, ['foo', 'x'])
+        with self.assertRaises(ValueError):
+            self.parser.command('foo', Bar, 'bar title')
+
+    def test_rejects_vanilla_callable(self):
+        with self.assertRaises(NotImplementedError):
+            self.parser.command('foo', print, 'foo title')
+
+    def test_rejects_non_command(self):
+        for commandish in (None, 'foo', 3):
+            with self.assertRaises(TypeError):
+                self.parser.command('foo', commandish, 'foo title')
+
+
+class Grouped(cliscape.Command):
+    '''Grouped description'''
+
+    def declare(self, arg):
+        def declare_group(parser):
+            group = parser.argparser.add_argument_group('grouped')
+            group.add_argument('--level')
+        arg(declare_group)
+
+    def run(self, args):
+        print('grouped', args.level)
+
+
+class Test_arg(unittest.TestCase):
+
+    def test_declaring_function_gets_parser(self):
+        parser = cliscape.Parser.new(prog='cli')
+        parser.command('grouped', Grouped, 'grouped title')
+        _, stdout, _ = dispatch(parser, ['grouped', '--level', '2'])
+        self.assertEqual('grouped 2\n', stdout)
+
+    def test_help_shows_default(self):
+        parser = cliscape.Parser.new(prog='cli')
+        parser.arg('--size', default=7, help='the size')
+        _, stdout, _ = dispatch(parser, ['-h'])
+        self.assertIn('the size (default: 7)', stdout)
+
+
+class Outer(cliscape.Command):
+    '''Outer description'''
+
+    def declare(self, arg):
+        def declare_subcommands(parser):
+            parser.command('baz', Baz, 'baz title')
+            parser.command('bar', Bar, 'bar title')
+        arg(declare_subcommands)
+
+
+class Test_nested(unittest.TestCase):
+
+    def setUp(self):
+        del made[:]
+        self.parser = cliscape.Parser.new(prog='cli')
+        self.parser.command('outer', Outer, 'outer title')
+
+    def test_runs_subcommand(self):
+        status, stdout, _ = dispatch(self.parser, ['outer', 'baz'])
+        self.assertEqual(0, status)
+        self.assertEqual('baz\n', stdout)
+        self.assertEqual(['baz'], made)
+
+    def test_help_lists_subcommands(self):
+        _, stdout, _ = dispatch(self.parser, ['outer', '-h'])
+        self.assertIn('{baz,bar}', stdout)
+
+    def test_invalid_subcommand_lists_all_subcommands(self):
+        status, _, stderr = dispatch(self.parser, ['outer', 'qux'])
+        self.assertEqual(2, status)
+        self.assertIn("choose from 'baz', 'bar'", stderr)
+
+
+class Reusable(cliscape.Command):
+    '''Reusable description'''
+
+    _cliscape_reusable = True
+
+    def __init__(self):
+        made.append('reusable')
+
+    def run(self, args):
+        print('reusable')
+
+
+class Test_reusable(unittest.TestCase):
+
+    def setUp(self):
+        del made[:]
+
+    def make_parser(self):
+        parser = cliscape.Parser.new(prog='cli')
+        parser.group('grp').command('r3', Reusable, 'r3 title')
+        parser.commands(
+            'r1', Reusable, 'r1 title',
+            'r2', Reusable, 'r2 title',
+            'bar', Bar, 'bar title',
+            'bar2', Bar, 'bar2 title')
+        return parser
+
+    def test_made_once_per_parser_tree(self):
+        parser = self.make_parser()
+        dispatch(parser, ['-h'])
+        dispatch(parser, ['grp', 'r3'])
+        self.assertEqual(1, made.count('reusable'))
+
+    def test_not_shared_between_parsers(self):
+        dispatch(self.make_parser(), ['r1'])
+        dispatch(self.make_parser(), ['r1'])
+        self.assertEqual(['reusable', 'reusable'], made)
+
+    def test_not_reusable_by_default(self):
+        dispatch(self.make_parser(), ['-h'])
+        self.assertEqual(2, made.count('bar'))
+
+
+class Test_group(unittest.TestCase):
+
+    def setUp(self):
+        del made[:]
+        self.parser = cliscape.Parser.new(prog='cli')
+        group = self.parser.group('grp', 'group title')
+        group.command('baz', Baz, 'baz title')
+        group.command('bar', Bar, 'bar title')
+        self.parser.command('foo', Foo, 'foo title')
+
+    def test_runs_group_command(self):
+        _, stdout, _ = dispatch(self.parser, ['grp', 'baz'])
+        self.assertEqual('baz\n', stdout)
+        self.assertEqual(['baz'], made)
+
+    def test_group_help_lists_its_commands(self):
+        _, stdout, _ = dispatch(self.parser, ['grp'])
+        self.assertIn('{baz,bar}', stdout)
+
+    def test_help_lists_commands_in_declaration_order(self):
+        _, stdout, _ = dispatch(self.parser, ['-h'])
+        self.assertIn('{grp,foo}', stdout)
+
+    def test_group_keeps_earlier_commands_lazy(self):
+        parser = cliscape.Parser.new(prog='cli')
+        parser.command('foo', Foo, 'foo title')
+        parser.group('grp').command('baz', Baz, 'baz title')
+        parser.command('bar', Bar, 'bar title')
+        dispatch(parser, ['grp', 'baz'])
+        self.assertEqual(['baz'], made)
+        _, stdout, _ = dispatch(parser, ['-h'])
+        self.assertIn('{foo,grp,bar}', stdout)
+
+
+if __name__ == '__main__':
+    unittest.main()